@@ -14,6 +14,8 @@ from xml.etree import ElementTree
 from dotenv import load_dotenv
 from supabase import Client, create_client
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import requests
 import asyncio
 import json
@@ -34,6 +36,17 @@ dotenv_path = project_root / '.env'
 # Force override of existing environment variables
 load_dotenv(dotenv_path, override=True)
 
+# Shared HTTP session so repeated sitemap fetches reuse pooled keep-alive connections
+# instead of paying a new TCP + TLS handshake each time
+http_session = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=100,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+)
+http_session.mount('https://', _http_adapter)
+http_session.mount('http://', _http_adapter)
+
 # Create a dataclass for our application context
 @dataclass
 class Crawl4AIContext:
@@ -126,7 +139,7 @@ def parse_sitemap(sitemap_url: str) -> List[str]:
     Returns:
         List of URLs found in the sitemap
     """
-    resp = requests.get(sitemap_url)
+    resp = http_session.get(sitemap_url, timeout=30)
     urls = []
 
     if resp.status_code == 200:
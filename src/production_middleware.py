@@ -3,22 +3,91 @@ Production middleware and monitoring for Crawl4AI REST API.
 """
 import os
 import time
+import secrets
+import functools
 import logging
 import json
-from datetime import datetime
-from typing import Dict, Any, Optional
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+import orjson
 from pythonjsonlogger import jsonlogger
 from prometheus_client import Counter, Histogram, Gauge, generate_latest
 from fastapi import Request, Response, HTTPException
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi.responses import PlainTextResponse, ORJSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-import sentry_sdk
-from sentry_sdk.integrations.fastapi import FastApiIntegration
-from sentry_sdk.integrations.logging import LoggingIntegration
+
+log = logging.getLogger(__name__)
+
+# Environment-derived configuration, read once
+@dataclass(frozen=True)
+class _Config:
+    """Environment-derived settings for the production features."""
+    log_level: str
+    sentry_dsn: Optional[str]
+    sentry_traces_sample_rate: float
+    environment: str
+    redis_url: str
+    cors_allowed_origins: Tuple[str, ...]
+
+    @classmethod
+    def from_env(cls) -> "_Config":
+        """Read all production settings from the environment in one pass."""
+        origins = tuple(
+            origin.strip()
+            for origin in os.getenv("CORS_ALLOWED_ORIGINS", "").split(",")
+            if origin.strip()
+        )
+        return cls(
+            log_level=os.getenv("LOG_LEVEL", "INFO"),
+            sentry_dsn=os.getenv("SENTRY_DSN"),
+            sentry_traces_sample_rate=float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "0.05")),
+            environment=os.getenv("RAILWAY_ENVIRONMENT", "development"),
+            redis_url=os.getenv("REDIS_URL", "memory://"),
+            cors_allowed_origins=origins
+        )
+
+_config: Optional[_Config] = None
+
+def get_config() -> _Config:
+    """Return the cached configuration, reading the environment on first use."""
+    global _config
+    if _config is None:
+        _config = _Config.from_env()
+    return _config
 
 # Configure structured JSON logging
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+class OrjsonFormatter(jsonlogger.JsonFormatter):
+    """
+    JSON log formatter that serializes records with orjson.
+    
+    The format is fixed to LOG_FORMAT, so the standard fields are copied with
+    direct attribute reads instead of the generic per-field lookup loop.
+    """
+    
+    def add_fields(self, log_record, record, message_dict):
+        log_record["asctime"] = record.asctime
+        log_record["levelname"] = record.levelname
+        log_record["name"] = record.name
+        log_record["message"] = record.message
+        log_record.update(message_dict)
+        jsonlogger.merge_record_extra(record, log_record, reserved=self._skip_fields)
+    
+    def jsonify_log_record(self, log_record):
+        return orjson.dumps(
+            log_record,
+            default=str,
+            option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+        ).decode()
+
 def setup_json_logging(log_level: str = "INFO"):
     """Configure JSON structured logging."""
     # Create logger
@@ -29,8 +98,8 @@ def setup_json_logging(log_level: str = "INFO"):
         logger.removeHandler(handler)
     
     # Create JSON formatter
-    formatter = jsonlogger.JsonFormatter(
-        fmt='%(asctime)s %(levelname)s %(name)s %(message)s',
+    formatter = OrjsonFormatter(
+        fmt=LOG_FORMAT,
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
@@ -45,11 +114,34 @@ def setup_json_logging(log_level: str = "INFO"):
     return logger
 
 # Configure Sentry error tracking
+_sentry_enabled = False
+
+# Paths polled by infrastructure that should never produce traces
+_UNTRACED_PATHS = frozenset({"/metrics", "/health"})
+
+def _traces_sampler(sampling_context: Dict[str, Any]) -> float:
+    """Sample a fraction of request transactions, skipping health and metrics polls."""
+    parent_sampled = sampling_context.get("parent_sampled")
+    if parent_sampled is not None:
+        return float(parent_sampled)
+    
+    path = sampling_context.get("asgi_scope", {}).get("path", "")
+    if path in _UNTRACED_PATHS:
+        return 0.0
+    return get_config().sentry_traces_sample_rate
+
 def setup_sentry(dsn: Optional[str] = None):
     """Initialize Sentry error tracking."""
-    sentry_dsn = dsn or os.getenv("SENTRY_DSN")
+    global _sentry_enabled
+    config = get_config()
+    sentry_dsn = dsn or config.sentry_dsn
     
     if sentry_dsn:
+        # Imported lazily so deployments without Sentry don't pay for loading the SDK
+        import sentry_sdk
+        from sentry_sdk.integrations.fastapi import FastApiIntegration
+        from sentry_sdk.integrations.logging import LoggingIntegration
+        
         sentry_logging = LoggingIntegration(
             level=logging.INFO,
             event_level=logging.ERROR
@@ -61,19 +153,38 @@ def setup_sentry(dsn: Optional[str] = None):
                 FastApiIntegration(transaction_style="endpoint"),
                 sentry_logging
             ],
-            traces_sample_rate=1.0,
-            environment=os.getenv("RAILWAY_ENVIRONMENT", "development")
+            traces_sampler=_traces_sampler,
+            profiles_sample_rate=0.0,
+            environment=config.environment
         )
+        _sentry_enabled = True
         return True
     return False
 
 # Configure rate limiting
+REDIS_MAX_CONNECTIONS = 50
+
 def create_rate_limiter():
     """Create and configure rate limiter."""
+    storage_uri = get_config().redis_url
+    
+    if storage_uri.startswith(("redis://", "rediss://")):
+        # Shared Redis storage keeps limits correct across uvicorn workers; the
+        # moving window is checked with a single atomic Lua call per request
+        # over a bounded, reused connection pool
+        return Limiter(
+            key_func=get_remote_address,
+            default_limits=["200 per day", "50 per hour"],
+            storage_uri=storage_uri,
+            storage_options={"max_connections": REDIS_MAX_CONNECTIONS},
+            strategy="moving-window"
+        )
+    
+    # In-memory counters are per process, so this is only accurate with a single worker
     return Limiter(
         key_func=get_remote_address,
         default_limits=["200 per day", "50 per hour"],
-        storage_uri=os.getenv("REDIS_URL", "memory://")
+        storage_uri=storage_uri
     )
 
 # Prometheus metrics
@@ -112,90 +223,195 @@ ERROR_COUNT = Counter(
     ['error_type']
 )
 
+# Endpoint label used for requests that did not match any route
+_UNMATCHED_ENDPOINT = "<unmatched>"
+
+# Cached label children for the per-request metrics
+@functools.lru_cache(maxsize=1024)
+def _req_counter(method: str, path: str, status: int):
+    """Return the REQUEST_COUNT child for a label set."""
+    return REQUEST_COUNT.labels(method=method, endpoint=path, status=status)
+
+@functools.lru_cache(maxsize=1024)
+def _req_latency(method: str, path: str):
+    """Return the REQUEST_LATENCY child for a label set."""
+    return REQUEST_LATENCY.labels(method=method, endpoint=path)
+
+class _RequestMetricsBuffer:
+    """
+    Accumulates per-request metric updates and applies them in bulk.
+    
+    Requests only touch plain dicts; the Prometheus children (and their locks)
+    are updated once per label set when the buffer is flushed, either after
+    flush_interval seconds or right before /metrics is rendered.
+    """
+    
+    def __init__(self, flush_interval: float = 0.1):
+        self.flush_interval = flush_interval
+        self.counts = defaultdict(int)
+        self.durations = defaultdict(list)
+        self.last_flush = time.perf_counter()
+    
+    def record(self, method: str, path: str, status: int, duration: float):
+        self.counts[(method, path, status)] += 1
+        self.durations[(method, path)].append(duration)
+        if time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        counts, self.counts = self.counts, defaultdict(int)
+        durations, self.durations = self.durations, defaultdict(list)
+        self.last_flush = time.perf_counter()
+        
+        for labels, count in counts.items():
+            _req_counter(*labels).inc(count)
+        for labels, values in durations.items():
+            histogram = _req_latency(*labels)
+            for value in values:
+                histogram.observe(value)
+
+_request_metrics = _RequestMetricsBuffer()
+
 # Middleware for request logging and metrics
-async def logging_middleware(request: Request, call_next):
-    """Log all requests and collect metrics."""
-    start_time = time.time()
+class LoggingMiddleware:
+    """
+    Log all requests and collect metrics.
     
-    # Get request details
-    request_id = request.headers.get("X-Request-ID", f"{time.time()}")
+    Implemented as a plain ASGI middleware rather than through
+    @app.middleware("http"), which wraps every request in BaseHTTPMiddleware's
+    task group and body stream.
+    """
     
-    # Log request
-    logger = logging.getLogger(__name__)
-    logger.info(
-        "Request received",
-        extra={
-            "request_id": request_id,
-            "method": request.method,
-            "path": request.url.path,
-            "client_host": request.client.host if request.client else "unknown",
-            "user_agent": request.headers.get("User-Agent", "unknown")
-        }
-    )
+    def __init__(self, app):
+        self.app = app
     
-    # Process request
-    try:
-        response = await call_next(request)
-        duration = time.time() - start_time
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Update metrics
-        REQUEST_COUNT.labels(
-            method=request.method,
-            endpoint=request.url.path,
-            status=response.status_code
-        ).inc()
+        start_time = time.perf_counter()
         
-        REQUEST_LATENCY.labels(
-            method=request.method,
-            endpoint=request.url.path
-        ).observe(duration)
+        # Get request details
+        method = scope["method"]
+        path = scope["path"]
+        # ASGI header names are already lowercased; pick out both in one pass
+        raw_request_id = None
+        raw_user_agent = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                raw_request_id = value
+            elif name == b"user-agent":
+                raw_user_agent = value
+        request_id = raw_request_id.decode("latin-1") if raw_request_id else secrets.token_hex(8)
         
-        # Log response
-        logger.info(
-            "Request completed",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "status_code": response.status_code,
-                "duration_seconds": duration
-            }
-        )
+        # Skip building log records entirely when INFO is filtered out
+        info_enabled = log.isEnabledFor(logging.INFO)
         
-        # Add request ID to response headers
-        response.headers["X-Request-ID"] = request_id
+        # Log request
+        if info_enabled:
+            client = scope.get("client")
+            log.info(
+                "Request received",
+                extra={
+                    "request_id": request_id,
+                    "method": method,
+                    "path": path,
+                    "client_host": client[0] if client else "unknown",
+                    "user_agent": raw_user_agent.decode("latin-1") if raw_user_agent else "unknown"
+                }
+            )
         
-        return response
+        status_code = 500
         
-    except Exception as e:
-        duration = time.time() - start_time
-        ERROR_COUNT.labels(error_type=type(e).__name__).inc()
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Add request ID to response headers
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
         
-        # Log error
-        logger.error(
-            "Request failed",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "error": str(e),
-                "error_type": type(e).__name__,
-                "duration_seconds": duration
-            },
-            exc_info=True
-        )
+        # Process request
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except Exception as e:
+            duration = time.perf_counter() - start_time
+            ERROR_COUNT.labels(error_type=type(e).__name__).inc()
+            
+            # Log error
+            log.error(
+                "Request failed",
+                extra={
+                    "request_id": request_id,
+                    "method": method,
+                    "path": path,
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "duration_seconds": duration
+                },
+                exc_info=True
+            )
+            
+            # Re-raise the exception
+            raise
+        
+        duration = time.perf_counter() - start_time
         
-        # Re-raise the exception
-        raise
+        # Label metrics by route template so path parameters and unknown URLs
+        # cannot create unbounded time series
+        route = scope.get("route")
+        endpoint = route.path if route is not None else _UNMATCHED_ENDPOINT
+        
+        # Update metrics
+        _request_metrics.record(method, endpoint, status_code, duration)
+        
+        # Log response
+        if info_enabled:
+            log.info(
+                "Request completed",
+                extra={
+                    "request_id": request_id,
+                    "method": method,
+                    "path": path,
+                    "status_code": status_code,
+                    "duration_seconds": duration
+                }
+            )
 
 # Advanced CORS configuration
+def _compile_origin_regex(origins) -> Tuple[list, Optional[re.Pattern]]:
+    """
+    Split CORS origins into exact origins and one compiled wildcard pattern.
+    
+    Starlette's allow_origins only does exact matching, so entries like
+    "https://*.railway.app" have to go through allow_origin_regex instead.
+    Once a pattern is needed anyway, the exact origins are folded into it too,
+    so every request costs a single fullmatch rather than a match plus a list scan.
+    """
+    exact_origins = []
+    patterns = []
+    for origin in origins:
+        if origin == "*" or "*" not in origin:
+            exact_origins.append(origin)
+            continue
+        pattern = re.escape(origin)
+        pattern = pattern.replace(r"\*\.", r"(?:[a-z0-9-]+\.)+")
+        pattern = pattern.replace(r"\*", r"[a-z0-9-]+")
+        patterns.append(pattern)
+    
+    if not patterns or "*" in exact_origins:
+        return exact_origins, None
+    patterns.extend(re.escape(origin) for origin in exact_origins)
+    return [], re.compile("|".join(f"(?:{p})" for p in patterns))
+
 def setup_advanced_cors(app):
     """Configure advanced CORS settings."""
     from fastapi.middleware.cors import CORSMiddleware
     
     # Get allowed origins from environment
-    allowed_origins = os.getenv("CORS_ALLOWED_ORIGINS", "").split(",")
-    if not allowed_origins or allowed_origins == [""]:
+    allowed_origins = list(get_config().cors_allowed_origins)
+    if not allowed_origins:
         # Default allowed origins
         allowed_origins = [
             "http://localhost:3000",
@@ -205,23 +421,24 @@ def setup_advanced_cors(app):
             "https://*.vercel.app",
             "https://*.netlify.app"
         ]
+    exact_origins, origin_regex = _compile_origin_regex(allowed_origins)
     
     # Remove existing CORS middleware if any
-    for i, middleware in enumerate(app.user_middleware):
-        if middleware.cls == CORSMiddleware:
-            app.user_middleware.pop(i)
-            break
+    app.user_middleware = [
+        middleware for middleware in app.user_middleware
+        if middleware.cls is not CORSMiddleware
+    ]
     
     # Add advanced CORS middleware
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=allowed_origins,
+        allow_origins=exact_origins,
+        allow_origin_regex=origin_regex.pattern if origin_regex else None,
         allow_credentials=True,
         allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD"],
+        # Starlette always allows the CORS-safelisted headers (Accept,
+        # Accept-Language, Content-Language, Content-Type) on top of these
         allow_headers=[
-            "Accept",
-            "Accept-Language",
-            "Content-Type",
             "Authorization",
             "X-Request-ID",
             "X-API-Key"
@@ -236,39 +453,65 @@ def setup_advanced_cors(app):
     )
 
 # Metrics endpoint
+METRICS_CACHE_TTL_SECONDS = 1.0
+_metrics_cache = {"ts": 0.0, "body": b""}
+
 async def metrics_endpoint(request: Request):
     """Prometheus metrics endpoint."""
+    # Serialize at most once per TTL window when several scrapers poll at once
+    now = time.monotonic()
+    if now - _metrics_cache["ts"] > METRICS_CACHE_TTL_SECONDS:
+        _request_metrics.flush()
+        _metrics_cache.update(ts=now, body=generate_latest())
+    
     return PlainTextResponse(
-        generate_latest(),
+        _metrics_cache["body"],
         media_type="text/plain; version=0.0.4; charset=utf-8"
     )
 
+# Second-resolution timestamp cache for error responses
+_iso_ts_cache = (0, "")
+
+def _now_iso() -> str:
+    """
+    Return the current UTC time as ISO 8601, formatted at most once per second.
+    
+    Keeps the naive format of datetime.utcnow().isoformat() that error bodies have always
+    used (no UTC offset); the only change is that microseconds are dropped.
+    """
+    global _iso_ts_cache
+    second = int(time.time())
+    cached_second, cached_value = _iso_ts_cache
+    if second != cached_second:
+        cached_value = datetime.fromtimestamp(second, timezone.utc).replace(tzinfo=None).isoformat()
+        _iso_ts_cache = (second, cached_value)
+    return cached_value
+
 # Custom error handlers
 async def custom_404_handler(request: Request, exc: HTTPException):
     """Custom 404 error handler."""
-    logger = logging.getLogger(__name__)
-    logger.warning(
-        "404 Not Found",
-        extra={
-            "path": request.url.path,
-            "method": request.method,
-            "client_host": request.client.host if request.client else "unknown"
-        }
-    )
+    if log.isEnabledFor(logging.WARNING):
+        log.warning(
+            "404 Not Found",
+            extra={
+                "path": request.url.path,
+                "method": request.method,
+                "client_host": request.client.host if request.client else "unknown"
+            }
+        )
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=404,
         content={
             "error": "Not Found",
             "message": f"The requested endpoint {request.url.path} does not exist",
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _now_iso()
         }
     )
 
 async def custom_500_handler(request: Request, exc: Exception):
     """Custom 500 error handler."""
-    logger = logging.getLogger(__name__)
-    logger.error(
+    log.error(
         "Internal Server Error",
         extra={
             "path": request.url.path,
@@ -280,23 +523,29 @@ async def custom_500_handler(request: Request, exc: Exception):
     )
     
     # Send to Sentry if configured
-    sentry_sdk.capture_exception(exc)
+    if _sentry_enabled:
+        import sentry_sdk
+        sentry_sdk.capture_exception(exc)
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal Server Error",
             "message": "An unexpected error occurred. Please try again later.",
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _now_iso()
         }
     )
 
 # Initialize all production features
 def init_production_features(app, logger=None):
     """Initialize all production features for the FastAPI app."""
+    # Read environment-derived settings once (after .env has been loaded)
+    global _config
+    _config = _Config.from_env()
+    
     # Setup logging
     if logger is None:
-        logger = setup_json_logging(os.getenv("LOG_LEVEL", "INFO"))
+        logger = setup_json_logging(_config.log_level)
     
     # Setup Sentry
     sentry_enabled = setup_sentry()
@@ -308,10 +557,16 @@ def init_production_features(app, logger=None):
     app.state.limiter = limiter
     app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
     
-    # Add middleware
-    @app.middleware("http")
-    async def add_logging_middleware(request: Request, call_next):
-        return await logging_middleware(request, call_next)
+    # Add middleware. add_middleware() prepends, so CORS is registered last to
+    # make it the outermost layer: every response leaving LoggingMiddleware,
+    # including error responses it lets through, gets CORS headers. The stack
+    # is built lazily on the first request, so no explicit rebuild is needed.
+    app.add_middleware(LoggingMiddleware)
+    
+    # Compress larger responses (playground page, RAG results); level 6 keeps most of
+    # level 9's ratio at a fraction of the CPU. Responses that set their own
+    # Content-Encoding (e.g. the unbuffered crawl stream) are passed through untouched.
+    app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=6)
     
     # Setup advanced CORS
     setup_advanced_cors(app)
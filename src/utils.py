@@ -2,14 +2,20 @@
 Utility functions for the Crawl4AI MCP server.
 """
 import os
+import asyncio
 import concurrent.futures
+import functools
+import hmac
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Tuple
 import json
 from supabase import create_client, Client
 from urllib.parse import urlparse
 import openai
-from datetime import datetime, timedelta
+from datetime import datetime
 import re
+import time
 
 # Load OpenAI API key for embeddings
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -99,6 +105,139 @@ def create_embedding(text: str) -> List[float]:
         # Return empty embedding if there's an error
         return [0.0] * 1536
 
+# Recent query embeddings, most recently used last. Repeated searches (dashboards,
+# autocomplete) skip the embedding API call, which dominates search latency.
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+_query_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+_query_embedding_lock = threading.Lock()
+
+def _cached_query_embedding(query: str) -> Optional[List[float]]:
+    """Return the cached embedding for a query, marking it as recently used."""
+    with _query_embedding_lock:
+        embedding = _query_embedding_cache.get(query)
+        if embedding is not None:
+            _query_embedding_cache.move_to_end(query)
+        return embedding
+
+def _remember_query_embedding(query: str, embedding: List[float]) -> None:
+    """Cache a query embedding, evicting the least recently used entry when full."""
+    # create_embedding returns a zero vector when the API call fails; don't cache that
+    if not any(embedding):
+        return
+    with _query_embedding_lock:
+        _query_embedding_cache[query] = embedding
+        _query_embedding_cache.move_to_end(query)
+        if len(_query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+
+def get_query_embedding(query: str) -> List[float]:
+    """
+    Create an embedding for a search query, reusing the embedding of a recent identical query.
+    
+    Args:
+        query: Query text
+        
+    Returns:
+        List of floats representing the embedding
+    """
+    embedding = _cached_query_embedding(query)
+    if embedding is None:
+        embedding = create_embedding(query)
+        _remember_query_embedding(query, embedding)
+    return embedding
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into shared embeddings API calls.
+    
+    Texts queued within max_wait seconds of each other (up to max_batch_size) are sent
+    as one create_embeddings_batch call, so a burst of searches costs one round trip
+    instead of one per search. Must be started inside a running event loop.
+    """
+    
+    def __init__(self, max_batch_size: int = 32, max_wait: float = 0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "asyncio.Queue[Tuple[str, asyncio.Future]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._flushes: set = set()
+    
+    def start(self) -> None:
+        """Start the background task that collects and flushes batches."""
+        self._task = asyncio.create_task(self._run())
+    
+    async def close(self) -> None:
+        """Stop collecting, wait for in-flight batches and fail anything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding batcher closed"))
+    
+    async def embed(self, text: str) -> List[float]:
+        """
+        Create an embedding for a text as part of the next batch.
+        
+        Args:
+            text: Text to create an embedding for
+            
+        Returns:
+            List of floats representing the embedding
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """Batched counterpart of get_query_embedding, sharing its cache."""
+        embedding = _cached_query_embedding(query)
+        if embedding is None:
+            embedding = await self.embed(query)
+            _remember_query_embedding(query, embedding)
+        return embedding
+    
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Flush in the background so the next batch collects while this one is in flight
+            flush = asyncio.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+    
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical texts in one batch (e.g. the same query from several clients) are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = await asyncio.to_thread(create_embeddings_batch, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        embedding_by_text = dict(zip(texts, embeddings))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(embedding_by_text[text])
+
 def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str, bool]:
     """
     Generate contextual information for a chunk within a document to improve retrieval.
@@ -164,6 +303,90 @@ def process_chunk_with_context(args):
     url, content, full_document = args
     return generate_contextual_embedding(full_document, content)
 
+def build_document_rows(
+    urls: List[str],
+    chunk_numbers: List[int],
+    contents: List[str],
+    metadatas: List[Dict[str, Any]],
+    url_to_full_document: Dict[str, str],
+    use_contextual_embeddings: bool
+) -> List[Dict[str, Any]]:
+    """
+    Build crawled_pages rows (with embeddings) for one batch of chunks.
+    
+    Args:
+        urls: List of URLs
+        chunk_numbers: List of chunk numbers
+        contents: List of document contents
+        metadatas: List of document metadata
+        url_to_full_document: Dictionary mapping URLs to their full document content
+        use_contextual_embeddings: Whether to situate each chunk in its document before embedding
+        
+    Returns:
+        List of rows ready for insertion
+    """
+    # Apply contextual embedding to each chunk if MODEL_CHOICE is set
+    if use_contextual_embeddings:
+        # Prepare arguments for parallel processing
+        process_args = []
+        for j, content in enumerate(contents):
+            url = urls[j]
+            full_document = url_to_full_document.get(url, "")
+            process_args.append((url, content, full_document))
+        
+        # Process in parallel using ThreadPoolExecutor
+        contextual_contents = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+            # Submit all tasks and collect results
+            future_to_idx = {executor.submit(process_chunk_with_context, arg): idx 
+                            for idx, arg in enumerate(process_args)}
+            
+            # Process results as they complete
+            for future in concurrent.futures.as_completed(future_to_idx):
+                idx = future_to_idx[future]
+                try:
+                    result, success = future.result()
+                    contextual_contents.append(result)
+                    if success:
+                        metadatas[idx]["contextual_embedding"] = True
+                except Exception as e:
+                    print(f"Error processing chunk {idx}: {e}")
+                    # Use original content as fallback
+                    contextual_contents.append(contents[idx])
+        
+        # Sort results back into original order if needed
+        if len(contextual_contents) != len(contents):
+            print(f"Warning: Expected {len(contents)} results but got {len(contextual_contents)}")
+            # Use original contents as fallback
+            contextual_contents = contents
+    else:
+        # If not using contextual embeddings, use original contents
+        contextual_contents = contents
+    
+    # Create embeddings for the entire batch at once
+    batch_embeddings = create_embeddings_batch(contextual_contents)
+    
+    batch_data = []
+    for j in range(len(contextual_contents)):
+        # Extract metadata fields
+        chunk_size = len(contextual_contents[j])
+        
+        # Prepare data for insertion
+        data = {
+            "url": urls[j],
+            "chunk_number": chunk_numbers[j],
+            "content": contextual_contents[j],  # Store original content
+            "metadata": {
+                "chunk_size": chunk_size,
+                **metadatas[j]
+            },
+            "embedding": batch_embeddings[j]  # Use embedding from contextual content
+        }
+        
+        batch_data.append(data)
+    
+    return batch_data
+
 def add_documents_to_supabase(
     client: Client, 
     urls: List[str], 
@@ -212,71 +435,14 @@ def add_documents_to_supabase(
     for i in range(0, len(contents), batch_size):
         batch_end = min(i + batch_size, len(contents))
         
-        # Get batch slices
-        batch_urls = urls[i:batch_end]
-        batch_chunk_numbers = chunk_numbers[i:batch_end]
-        batch_contents = contents[i:batch_end]
-        batch_metadatas = metadatas[i:batch_end]
-        
-        # Apply contextual embedding to each chunk if MODEL_CHOICE is set
-        if use_contextual_embeddings:
-            # Prepare arguments for parallel processing
-            process_args = []
-            for j, content in enumerate(batch_contents):
-                url = batch_urls[j]
-                full_document = url_to_full_document.get(url, "")
-                process_args.append((url, content, full_document))
-            
-            # Process in parallel using ThreadPoolExecutor
-            contextual_contents = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                # Submit all tasks and collect results
-                future_to_idx = {executor.submit(process_chunk_with_context, arg): idx 
-                                for idx, arg in enumerate(process_args)}
-                
-                # Process results as they complete
-                for future in concurrent.futures.as_completed(future_to_idx):
-                    idx = future_to_idx[future]
-                    try:
-                        result, success = future.result()
-                        contextual_contents.append(result)
-                        if success:
-                            batch_metadatas[idx]["contextual_embedding"] = True
-                    except Exception as e:
-                        print(f"Error processing chunk {idx}: {e}")
-                        # Use original content as fallback
-                        contextual_contents.append(batch_contents[idx])
-            
-            # Sort results back into original order if needed
-            if len(contextual_contents) != len(batch_contents):
-                print(f"Warning: Expected {len(batch_contents)} results but got {len(contextual_contents)}")
-                # Use original contents as fallback
-                contextual_contents = batch_contents
-        else:
-            # If not using contextual embeddings, use original contents
-            contextual_contents = batch_contents
-        
-        # Create embeddings for the entire batch at once
-        batch_embeddings = create_embeddings_batch(contextual_contents)
-        
-        batch_data = []
-        for j in range(len(contextual_contents)):
-            # Extract metadata fields
-            chunk_size = len(contextual_contents[j])
-            
-            # Prepare data for insertion
-            data = {
-                "url": batch_urls[j],
-                "chunk_number": batch_chunk_numbers[j],
-                "content": contextual_contents[j],  # Store original content
-                "metadata": {
-                    "chunk_size": chunk_size,
-                    **batch_metadatas[j]
-                },
-                "embedding": batch_embeddings[j]  # Use embedding from contextual content
-            }
-            
-            batch_data.append(data)
+        batch_data = build_document_rows(
+            urls[i:batch_end],
+            chunk_numbers[i:batch_end],
+            contents[i:batch_end],
+            metadatas[i:batch_end],
+            url_to_full_document,
+            use_contextual_embeddings
+        )
         
         # Insert batch into Supabase
         try:
@@ -284,6 +450,72 @@ def add_documents_to_supabase(
         except Exception as e:
             print(f"Error inserting batch into Supabase: {e}")
 
+def _vector_literal(embedding: List[float]) -> str:
+    """Format an embedding in pgvector's text form, '[x,y,...]'."""
+    return "[" + ",".join(map(repr, embedding)) + "]"
+
+async def add_documents_pg(
+    pool,
+    urls: List[str], 
+    chunk_numbers: List[int],
+    contents: List[str], 
+    metadatas: List[Dict[str, Any]],
+    url_to_full_document: Dict[str, str],
+    batch_size: int = 20
+) -> None:
+    """
+    Add documents to the crawled_pages table over a direct Postgres connection.
+    
+    Same rows as add_documents_to_supabase, but the delete is one statement and each batch
+    is written with a single executemany instead of a PostgREST request.
+    
+    Args:
+        pool: asyncpg connection pool (see init_pg_connection)
+        urls: List of URLs
+        chunk_numbers: List of chunk numbers
+        contents: List of document contents
+        metadatas: List of document metadata
+        url_to_full_document: Dictionary mapping URLs to their full document content
+        batch_size: Size of each batch for embedding and insertion
+    """
+    # Delete existing records for these URLs in a single statement
+    unique_urls = list(set(urls))
+    if unique_urls:
+        try:
+            async with pool.acquire() as connection:
+                await connection.execute("DELETE FROM crawled_pages WHERE url = ANY($1::text[])", unique_urls)
+        except Exception as e:
+            print(f"Batch delete failed: {e}")
+    
+    use_contextual_embeddings = bool(os.getenv("MODEL_CHOICE"))
+    
+    for i in range(0, len(contents), batch_size):
+        batch_end = min(i + batch_size, len(contents))
+        
+        # Embedding calls are blocking, so build the rows in a worker thread
+        batch_data = await asyncio.to_thread(
+            build_document_rows,
+            urls[i:batch_end],
+            chunk_numbers[i:batch_end],
+            contents[i:batch_end],
+            metadatas[i:batch_end],
+            url_to_full_document,
+            use_contextual_embeddings
+        )
+        
+        try:
+            async with pool.acquire() as connection:
+                await connection.executemany(
+                    "INSERT INTO crawled_pages (url, chunk_number, content, metadata, embedding) "
+                    "VALUES ($1, $2, $3, $4::jsonb, $5::text::vector)",
+                    [
+                        (row["url"], row["chunk_number"], row["content"], row["metadata"], _vector_literal(row["embedding"]))
+                        for row in batch_data
+                    ]
+                )
+        except Exception as e:
+            print(f"Error inserting batch into Postgres: {e}")
+
 def search_documents(
     client: Client, 
     query: str, 
@@ -302,9 +534,31 @@ def search_documents(
     Returns:
         List of matching documents
     """
-    # Create embedding for the query
-    query_embedding = create_embedding(query)
+    # Create (or reuse) the embedding for the query
+    query_embedding = get_query_embedding(query)
     
+    return search_documents_with_embedding(client, query_embedding, match_count, filter_metadata)
+
+def search_documents_with_embedding(
+    client: Client, 
+    query_embedding: List[float], 
+    match_count: int = 10, 
+    filter_metadata: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Search for documents in Supabase with an already computed query embedding.
+    
+    Lets one embedding be reused for several searches, e.g. one per source filter.
+    
+    Args:
+        client: Supabase client
+        query_embedding: Embedding of the query text
+        match_count: Maximum number of results to return
+        filter_metadata: Optional metadata filter
+        
+    Returns:
+        List of matching documents
+    """
     # Execute the search using the match_crawled_pages function
     try:
         # Only include filter parameter if filter_metadata is provided and not empty
@@ -324,6 +578,100 @@ def search_documents(
         print(f"Error searching documents: {e}")
         return []
 
+async def init_pg_connection(connection) -> None:
+    """
+    Prepare a new asyncpg pool connection: exchange jsonb values as Python objects.
+    
+    Args:
+        connection: asyncpg connection being added to the pool
+    """
+    await connection.set_type_codec(
+        "jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+    )
+
+async def search_documents_pg(
+    pool,
+    query_embedding: List[float],
+    match_count: int = 10,
+    filter_metadata: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Search for documents over a direct Postgres connection instead of PostgREST.
+    
+    Calls the same match_crawled_pages function as search_documents, so results are identical,
+    without the HTTP and JSON round trip through the REST gateway.
+    
+    Args:
+        pool: asyncpg connection pool (see init_pg_connection)
+        query_embedding: Embedding of the query text
+        match_count: Maximum number of results to return
+        filter_metadata: Optional metadata filter
+        
+    Returns:
+        List of matching documents
+    """
+    # pgvector parses its text form, so the embedding goes over the wire as '[x,y,...]'
+    vector_literal = _vector_literal(query_embedding)
+    
+    try:
+        async with pool.acquire(timeout=2.0) as connection:
+            rows = await connection.fetch(
+                "SELECT * FROM match_crawled_pages($1::text::vector, $2, $3::jsonb)",
+                vector_literal,
+                match_count,
+                filter_metadata or {}
+            )
+        return [dict(row) for row in rows]
+    except Exception as e:
+        print(f"Error searching documents: {e}")
+        return []
+
+def get_distinct_sources(client: Client) -> List[str]:
+    """
+    Get the distinct source domains of all stored chunks.
+    
+    Deduplication runs in Postgres through the get_distinct_sources function (see the README's
+    schema section), so only the distinct values cross the network.
+    
+    Args:
+        client: Supabase client
+        
+    Returns:
+        Sorted list of source domains
+    """
+    try:
+        result = client.rpc('get_distinct_sources').execute()
+    except Exception as e:
+        # Databases set up before get_distinct_sources existed: dedupe client-side instead
+        print(f"get_distinct_sources unavailable, scanning chunk metadata: {e}")
+        result = client.from_('crawled_pages')\
+            .select('metadata')\
+            .not_.is_('metadata->>source', 'null')\
+            .execute()
+        return sorted({
+            item['metadata']['source'] for item in result.data or []
+            if (item.get('metadata') or {}).get('source')
+        })
+    
+    return sorted(row['source'] for row in result.data or [] if row.get('source'))
+
+async def get_distinct_sources_pg(pool) -> List[str]:
+    """
+    Get the distinct source domains of all stored chunks over a direct Postgres connection.
+    
+    Args:
+        pool: asyncpg connection pool
+        
+    Returns:
+        Sorted list of source domains
+    """
+    async with pool.acquire(timeout=2.0) as connection:
+        rows = await connection.fetch(
+            "SELECT DISTINCT metadata->>'source' AS source FROM crawled_pages "
+            "WHERE metadata->>'source' IS NOT NULL"
+        )
+    return sorted(row['source'] for row in rows)
+
 def check_url_freshness(client: Client, url: str, freshness_days: int = 30) -> Tuple[bool, Optional[datetime]]:
     """
     Check if a URL was crawled recently within the freshness period.
@@ -339,8 +687,9 @@ def check_url_freshness(client: Client, url: str, freshness_days: int = 30) -> T
         - The datetime when it was last crawled, or None if never crawled
     """
     try:
-        # Calculate the cutoff date
-        cutoff_date = datetime.utcnow() - timedelta(days=freshness_days)
+        # Calculate the cutoff as epoch seconds; created_at comes back tz-aware, so
+        # comparing timestamps avoids mixing naive and aware datetimes
+        cutoff_ts = time.time() - freshness_days * 86400
         
         # Query the database to check when this URL was last crawled
         result = client.table("crawled_pages")\
@@ -359,7 +708,7 @@ def check_url_freshness(client: Client, url: str, freshness_days: int = 30) -> T
         last_crawled = datetime.fromisoformat(last_crawled_str.replace('Z', '+00:00'))
         
         # Check if it's within the freshness period
-        is_fresh = last_crawled > cutoff_date
+        is_fresh = last_crawled.timestamp() > cutoff_ts
         
         return is_fresh, last_crawled
         
@@ -368,6 +717,36 @@ def check_url_freshness(client: Client, url: str, freshness_days: int = 30) -> T
         # In case of error, assume we should crawl (err on the side of freshness)
         return False, None
 
+def get_last_crawled_map(client: Client, urls: List[str]) -> Dict[str, datetime]:
+    """
+    Look up when each of several URLs was last crawled, in one PostgREST query.
+    
+    Only the first chunk of each page is fetched (chunk 1 here, chunk 0 for pages stored by
+    the MCP server); a page's chunks are all written together, so it carries the crawl time.
+    
+    Args:
+        client: Supabase client
+        urls: URLs to look up
+        
+    Returns:
+        Dictionary mapping each previously crawled URL to its most recent crawl time;
+        URLs that were never crawled are absent
+    """
+    result = client.table("crawled_pages")\
+        .select("url, created_at")\
+        .in_("url", urls)\
+        .lte("chunk_number", 1)\
+        .execute()
+    
+    last_crawled_map = {}
+    for row in result.data or []:
+        last_crawled = datetime.fromisoformat(row["created_at"].replace('Z', '+00:00'))
+        previous = last_crawled_map.get(row["url"])
+        if previous is None or last_crawled > previous:
+            last_crawled_map[row["url"]] = last_crawled
+    
+    return last_crawled_map
+
 def get_stale_urls(client: Client, urls: List[str], freshness_days: int = 30) -> List[str]:
     """
     Filter a list of URLs to return only those that need re-crawling.
@@ -378,30 +757,93 @@ def get_stale_urls(client: Client, urls: List[str], freshness_days: int = 30) ->
         freshness_days: Number of days to consider content fresh (default: 30)
         
     Returns:
-        List of URLs that need to be crawled (either never crawled or stale)
+        List of URLs that need to be crawled (either never crawled or stale), in input order
     """
-    stale_urls = []
+    if not urls:
+        return []
     
-    for url in urls:
-        is_fresh, last_crawled = check_url_freshness(client, url, freshness_days)
-        if not is_fresh:
-            stale_urls.append(url)
+    try:
+        last_crawled_map = get_last_crawled_map(client, urls)
+    except Exception as e:
+        print(f"Error checking URL freshness: {e}")
+        # In case of error, assume we should crawl (err on the side of freshness)
+        return list(urls)
     
-    return stale_urls
+    cutoff_ts = time.time() - freshness_days * 86400
+    return [
+        url for url in urls
+        if (last_crawled := last_crawled_map.get(url)) is None or last_crawled.timestamp() <= cutoff_ts
+    ]
+
+async def get_last_crawled_pg(pool, urls: List[str]) -> Dict[str, datetime]:
+    """
+    Look up when each of several URLs was last crawled, in one query over a direct Postgres connection.
+    
+    Args:
+        pool: asyncpg connection pool
+        urls: URLs to look up
+        
+    Returns:
+        Dictionary mapping each previously crawled URL to its most recent crawl time;
+        URLs that were never crawled are absent
+    """
+    async with pool.acquire(timeout=2.0) as connection:
+        rows = await connection.fetch(
+            "SELECT url, max(created_at) AS last_crawled FROM crawled_pages "
+            "WHERE url = ANY($1::text[]) GROUP BY url",
+            urls
+        )
+    return {row["url"]: row["last_crawled"] for row in rows}
+
+async def get_stale_urls_pg(pool, urls: List[str], freshness_days: int = 30) -> List[str]:
+    """
+    Filter a list of URLs to those that need re-crawling, like get_stale_urls but over a direct Postgres connection.
+    
+    Args:
+        pool: asyncpg connection pool
+        urls: List of URLs to check
+        freshness_days: Number of days to consider content fresh (default: 30)
+        
+    Returns:
+        List of URLs that need to be crawled (either never crawled or stale), in input order
+    """
+    try:
+        last_crawled_map = await get_last_crawled_pg(pool, urls)
+    except Exception as e:
+        print(f"Error checking URL freshness: {e}")
+        # In case of error, assume we should crawl (err on the side of freshness)
+        return list(urls)
+    
+    cutoff_ts = time.time() - freshness_days * 86400
+    return [
+        url for url in urls
+        if (last_crawled := last_crawled_map.get(url)) is None or last_crawled.timestamp() <= cutoff_ts
+    ]
+
+@functools.lru_cache(maxsize=1)
+def _expected_api_key() -> bytes:
+    """Configured API key, read once on first use (after the server has loaded its .env file)."""
+    return os.getenv("CRAWL4AI_API_KEY", "").encode()
+
+def api_key_required() -> bool:
+    """Whether requests must present an API key."""
+    return bool(_expected_api_key())
 
 def validate_api_key(api_key: str) -> bool:
     """
     Validate the provided API key against the configured API key.
     
+    The comparison is constant-time so response timing doesn't leak how much of a guess matched.
+    
     Args:
         api_key: The API key to validate
         
     Returns:
         Boolean indicating if the API key is valid
     """
-    expected_api_key = os.getenv("CRAWL4AI_API_KEY")
+    expected_api_key = _expected_api_key()
     if not expected_api_key:
         # If no API key is configured, allow all requests (for backward compatibility)
         return True
     
-    return api_key == expected_api_key
\ No newline at end of file
+    return hmac.compare_digest(api_key.encode(), expected_api_key)
@@ -10,8 +10,14 @@ def main():
     # Get port from Railway environment (defaults to 8000 for local)
     port = int(os.getenv('PORT', 8000))
     host = os.getenv('HOST', '0.0.0.0')
+    # Each worker launches its own headless browser and keeps its own in-memory
+    # rate limits, logs and metrics, so scale out deliberately (default: 1)
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    # Per-worker cap on in-flight connections; beyond it uvicorn answers 503
+    # straight away instead of queueing behind long-running crawls (default: no cap)
+    limit_concurrency = int(os.getenv('LIMIT_CONCURRENCY', 0)) or None
     
-    print(f"Starting Crawl4AI REST API on {host}:{port}")
+    print(f"Starting Crawl4AI REST API on {host}:{port} ({workers} worker(s))")
     
     # Run the FastAPI app
     uvicorn.run(
@@ -19,7 +25,15 @@ def main():
         host=host,
         port=port,
         log_level="info",
-        access_log=True
+        access_log=True,
+        # uvicorn picks uvloop/httptools when installed and falls back to
+        # asyncio/h11 otherwise; the loop has to be chosen here, before the
+        # app is imported, so it cannot be switched from inside the app
+        loop="auto",
+        http="auto",
+        workers=workers,
+        limit_concurrency=limit_concurrency,
+        backlog=2048
     )
 
 if __name__ == "__main__":
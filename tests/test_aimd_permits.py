@@ -0,0 +1,136 @@
+"""
+Unit tests for the AIMD session-permit controller used by the crawl dispatchers.
+
+AimdPermits only looks at the status code and dispatch timings of finished results,
+so these tests feed it fake results; no browser or network is involved.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from rest_api import AimdPermits
+
+
+def fake_result(latency=1.0, status_code=200):
+    """A crawl result that took `latency` seconds and answered with `status_code`."""
+    dispatch = None if latency is None else SimpleNamespace(start_time=100.0, end_time=100.0 + latency)
+    return SimpleNamespace(status_code=status_code, dispatch_result=dispatch)
+
+
+def record_all(permits, results):
+    for result in results:
+        permits.record(result)
+
+
+def test_starts_at_max_permits():
+    permits = AimdPermits(8)
+    assert permits.limit == 8.0
+    assert permits.permits == 8
+
+
+def test_throttled_result_halves_without_waiting_for_the_window():
+    permits = AimdPermits(8)
+    permits.record(fake_result(status_code=429))
+    assert permits.limit == 4.0
+    assert permits.permits == 4
+
+
+def test_gateway_errors_count_as_throttling():
+    for status_code in (502, 503, 504):
+        permits = AimdPermits(8)
+        permits.record(fake_result(status_code=status_code))
+        assert permits.limit == 4.0
+
+
+def test_other_errors_do_not_throttle():
+    permits = AimdPermits(8)
+    record_all(permits, [fake_result(status_code=404), fake_result(status_code=500)])
+    assert permits.limit == 8.0
+
+
+def test_clean_window_of_one_permit_grows_by_alpha():
+    permits = AimdPermits(8)
+    permits.record(fake_result(status_code=429))
+
+    # The window is one permit's worth of results: 4 here, then still 4 at a limit of 4.5
+    record_all(permits, [fake_result()] * 3)
+    assert permits.limit == 4.0
+    permits.record(fake_result())
+    assert permits.limit == 4.5
+    assert permits.permits == 4
+
+    record_all(permits, [fake_result()] * 4)
+    assert permits.limit == 5.0
+    assert permits.permits == 5
+
+
+def test_limit_never_exceeds_max_permits():
+    permits = AimdPermits(4)
+    record_all(permits, [fake_result()] * 40)
+    assert permits.limit == 4.0
+
+
+def test_limit_never_drops_below_min_permits():
+    permits = AimdPermits(8, min_permits=2)
+    record_all(permits, [fake_result(status_code=503)] * 10)
+    assert permits.limit == 2.0
+    assert permits.permits == 2
+
+
+def test_min_permits_is_capped_by_max_permits():
+    permits = AimdPermits(1, min_permits=2)
+    permits.record(fake_result(status_code=429))
+    assert permits.permits == 1
+
+
+def test_target_latency_is_p95_of_the_warmup_results():
+    permits = AimdPermits(8, warmup=20)
+
+    record_all(permits, [fake_result(latency) for latency in range(1, 20)])
+    assert permits.target_latency is None
+
+    permits.record(fake_result(20))
+    # int(0.95 * 19) == 18, so the 19th of the sorted latencies
+    assert permits.target_latency == 19
+
+
+def test_results_without_timings_do_not_count_towards_warmup():
+    permits = AimdPermits(8, warmup=2)
+    record_all(permits, [fake_result(None)] * 5)
+    assert permits.target_latency is None
+    assert permits.limit == 8.0
+
+
+def test_slow_window_after_warmup_halves():
+    permits = AimdPermits(8, warmup=20)
+    # 20 warm-up results close two full windows and leave four in the third
+    record_all(permits, [fake_result(latency) for latency in range(1, 21)])
+    assert permits.limit == 8.0
+
+    # (17 + 18 + 19 + 20 + 4 * 30) / 8 = 24.25 > 19
+    record_all(permits, [fake_result(30)] * 4)
+    assert permits.limit == 4.0
+
+
+def test_fast_window_after_warmup_grows():
+    permits = AimdPermits(8, warmup=4)
+    record_all(permits, [fake_result(10)] * 4)
+    permits.record(fake_result(status_code=429))
+    assert permits.limit == 4.0
+
+    record_all(permits, [fake_result(1)] * 4)
+    assert permits.limit == 4.5
+
+
+def test_datetime_timings_are_supported():
+    start = datetime(2026, 1, 1)
+    result = SimpleNamespace(
+        status_code=200,
+        dispatch_result=SimpleNamespace(start_time=start, end_time=start + timedelta(seconds=3))
+    )
+    permits = AimdPermits(8, warmup=1)
+    permits.record(result)
+    assert permits.target_latency == 3.0
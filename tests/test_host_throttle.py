@@ -0,0 +1,145 @@
+"""
+Unit tests for the per-host throttle learned from rate-limit response headers.
+
+HostThrottle only reads a result's URL and response headers, so these tests feed it
+fake results; the recursive-crawl test uses a fake crawler, not a browser.
+"""
+import asyncio
+import os
+import sys
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import rest_api
+from rest_api import HostThrottle
+
+
+def fake_result(url, headers=None, links=()):
+    """A successful crawl result for `url` with the given response headers and internal links."""
+    return SimpleNamespace(
+        url=url,
+        success=True,
+        markdown=f"# {url}",
+        links={"internal": [{"href": link} for link in links]},
+        status_code=200,
+        response_headers=headers or {},
+        dispatch_result=None
+    )
+
+
+def throttle_after(headers, url="https://a.example/page"):
+    throttle = HostThrottle()
+    throttle.observe(fake_result(url, headers))
+    return throttle
+
+
+def test_no_headers_no_pause():
+    throttle = throttle_after({})
+    urls = ["https://a.example/1", "https://b.example/1"]
+    assert throttle.split(urls) == (urls, [])
+
+
+def test_retry_after_seconds():
+    throttle = throttle_after({"Retry-After": "30"})
+    ready, deferred = throttle.split(["https://a.example/next", "https://b.example/next"])
+    assert ready == ["https://b.example/next"]
+    assert deferred == ["https://a.example/next"]
+    assert 29 < throttle.seconds_until_ready(deferred) <= 30
+
+
+def test_retry_after_epoch_timestamp():
+    throttle = throttle_after({"Retry-After": str(int(time.time()) + 20)})
+    assert 18 < throttle.seconds_until_ready(["https://a.example/next"]) <= 20
+
+
+def test_retry_after_http_date():
+    throttle = throttle_after({"Retry-After": formatdate(time.time() + 45, usegmt=True)})
+    # HTTP dates only have whole seconds
+    assert 43 < throttle.seconds_until_ready(["https://a.example/next"]) <= 45
+
+
+def test_retry_after_in_the_past_or_unparseable_is_ignored():
+    for value in (formatdate(time.time() - 60, usegmt=True), "soon", "0"):
+        throttle = throttle_after({"Retry-After": value})
+        assert throttle.split(["https://a.example/next"]) == (["https://a.example/next"], [])
+
+
+def test_wait_is_capped():
+    throttle = throttle_after({"Retry-After": "3600"})
+    assert throttle.seconds_until_ready(["https://a.example/next"]) <= HostThrottle.MAX_WAIT_SECONDS
+
+
+def test_low_rate_limit_remaining_pauses_until_reset():
+    throttle = throttle_after({"X-RateLimit-Remaining": "5", "X-RateLimit-Limit": "100", "X-RateLimit-Reset": "10"})
+    assert 9 < throttle.seconds_until_ready(["https://a.example/next"]) <= 10
+
+    throttle = throttle_after({"RateLimit-Remaining": "5", "RateLimit-Limit": "100", "RateLimit-Reset": "10"})
+    assert 9 < throttle.seconds_until_ready(["https://a.example/next"]) <= 10
+
+
+def test_plenty_of_rate_limit_remaining_does_not_pause():
+    throttle = throttle_after({"X-RateLimit-Remaining": "50", "X-RateLimit-Limit": "100", "X-RateLimit-Reset": "10"})
+    assert throttle.split(["https://a.example/next"]) == (["https://a.example/next"], [])
+
+
+def test_longer_pause_wins():
+    throttle = HostThrottle()
+    throttle.observe(fake_result("https://a.example/1", {"Retry-After": "30"}))
+    throttle.observe(fake_result("https://a.example/2", {"Retry-After": "5"}))
+    assert throttle.seconds_until_ready(["https://a.example/next"]) > 29
+
+
+def test_seconds_until_ready_uses_the_first_host_ready():
+    throttle = HostThrottle()
+    throttle.observe(fake_result("https://a.example/1", {"Retry-After": "30"}))
+    throttle.observe(fake_result("https://b.example/1", {"Retry-After": "5"}))
+    assert 4 < throttle.seconds_until_ready(["https://a.example/next", "https://b.example/next"]) <= 5
+
+
+class FakeCrawler:
+    """Serves fake results from a site map and records the URLs of each arun_many call."""
+
+    def __init__(self, site):
+        self.site = site
+        self.batches = []
+
+    async def arun_many(self, urls, config=None, dispatcher=None):
+        self.batches.append(list(urls))
+
+        async def results():
+            for url in urls:
+                headers, links = self.site[url]
+                yield fake_result(url, headers, links)
+        return results()
+
+
+def test_throttled_host_is_deferred_to_the_next_depth():
+    site = {
+        "https://a.example/1": ({"Retry-After": "0.5"}, ["https://a.example/2"]),
+        "https://a.example/2": ({}, []),
+        "https://b.example/1": ({}, ["https://b.example/2"]),
+        "https://b.example/2": ({}, ["https://b.example/3"]),
+        "https://b.example/3": ({}, []),
+    }
+    crawler = FakeCrawler(site)
+
+    async def crawl():
+        return [
+            page["url"] async for page in rest_api.iter_recursive_internal_links(
+                crawler, ["https://a.example/1", "https://b.example/1"], max_depth=3
+            )
+        ]
+
+    pages = asyncio.run(crawl())
+
+    # a.example/2 skips depth 1 while its host is paused; at the last depth the crawl
+    # waits for the host instead of dropping the URL
+    assert crawler.batches == [
+        ["https://a.example/1", "https://b.example/1"],
+        ["https://b.example/2"],
+        ["https://b.example/3", "https://a.example/2"],
+    ]
+    assert sorted(pages) == sorted(site)